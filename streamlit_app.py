@@ -1,9 +1,23 @@
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import pydeck as pdk
 import altair as alt
 
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+CSV_ENGINE = "pyarrow" if HAVE_PYARROW else "c"
+
 # -----------------------------------------------------------
 # Page setup
 # -----------------------------------------------------------
@@ -23,24 +37,221 @@ st.sidebar.header("📊 Controls")
 
 uploaded_file = st.sidebar.file_uploader("Upload Boston Crimes CSV", type=["csv"])
 
-@st.cache_data
+# only the columns the dashboard uses, with their target dtypes
+CSV_COLUMNS = [
+    "OCCURRED_ON_DATE",
+    "DISTRICT",
+    "UCR_PART",
+    "SHOOTING",
+    "OFFENSE_CODE_GROUP",
+    "Lat",
+    "Long",
+]
+CSV_DTYPES = {
+    "DISTRICT": "category",
+    "UCR_PART": "category",
+    "OFFENSE_CODE_GROUP": "category",
+    "Lat": "float32",
+    "Long": "float32",
+}
+CATEGORY_COLUMNS = ["DISTRICT", "UCR_PART", "OFFENSE_CODE_GROUP", "SHOOTING"]
+
+# bump whenever load_data's output (columns, dtypes, derived columns) changes,
+# so Parquet files written by older code are never read back
+PARQUET_CACHE_VERSION = 1
+
+def parquet_cache_path(data):
+    # cache files live in a private per-user directory under the temp dir; if it
+    # can't be created or anyone else could write to it, caching is skipped
+    cache_dir = os.path.join(tempfile.gettempdir(), "crime-dashboard-cache")
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        info = os.stat(cache_dir)
+    except OSError:
+        return None
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+        return None
+    digest = hashlib.sha1(data).hexdigest()
+    return os.path.join(cache_dir, f"crime-v{PARQUET_CACHE_VERSION}-{digest}.parquet")
+
+# shared across reruns without copying; callers must treat the frame as read-only
+@st.cache_resource
 def load_data(file):
-    df = pd.read_csv(file, parse_dates=["OCCURRED_ON_DATE"])
+    # work on a copy of the bytes so the upload's stream position (part of its
+    # cache key) never moves and reruns keep hitting this same cache entry
+    data = file.getvalue()
+
+    # parsed + typed frames are kept as Parquet by content hash, so a new session
+    # on the same upload skips CSV parsing entirely
+    cache_path = parquet_cache_path(data) if HAVE_PYARROW else None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            df = pd.read_parquet(cache_path)
+            # Parquet only round-trips categoricals with string categories
+            # (e.g. 0/1 SHOOTING or an all-empty column come back numeric)
+            return df.astype({col: "category" for col in CATEGORY_COLUMNS})
+        except Exception:
+            # unreadable or foreign file: fall through and parse the CSV again
+            pass
+
+    df = pd.read_csv(
+        io.BytesIO(data),
+        engine=CSV_ENGINE,
+        usecols=CSV_COLUMNS,
+        dtype=CSV_DTYPES,
+        parse_dates=["OCCURRED_ON_DATE"],
+    )
     df = df.dropna(subset=["OCCURRED_ON_DATE"])
+    # day-resolution copy of the timestamp, kept as datetime64 for fast compares
+    df["DATE_ONLY"] = df["OCCURRED_ON_DATE"].dt.normalize()
+    # empty SHOOTING means no shooting; cast after cleanup so "" never becomes a category
+    df["SHOOTING"] = df["SHOOTING"].replace("", np.nan).astype("category")
+
+    if cache_path is not None:
+        # write then rename, so concurrent sessions never read a partial file;
+        # best effort only, the parsed frame is returned either way
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            df.to_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            # OSError for a read-only/full disk, pyarrow errors for e.g. a missing codec
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
     return df
 
+# sidebar choices only change with the upload, so don't rescan the frame per rerun;
+# `df` is held by st.cache_resource, so its id() is a stable, O(1) key for it
+@st.cache_data(hash_funcs={pd.DataFrame: id})
+def load_filter_options(df):
+    districts = sorted(df["DISTRICT"].dropna().unique().tolist())
+    return districts, df["DATE_ONLY"].min().date(), df["DATE_ONLY"].max().date()
+
+def category_code(series, value):
+    # code of `value` in a categorical series; -2 never matches (NaN is -1)
+    code = series.cat.categories.get_indexer([value])[0]
+    return code if code >= 0 else -2
+
+def downsample_minmax(frame, n_bins=250):
+    # keep the min and max row of each bin for every column (row order preserved)
+    if len(frame) <= 2 * n_bins:
+        return frame
+    edges = np.linspace(0, len(frame), n_bins + 1, dtype=int)
+    keep = []
+    for col in frame.columns:
+        values = frame[col].to_numpy()
+        for start, end in zip(edges[:-1], edges[1:]):
+            if end <= start:
+                continue
+            chunk = values[start:end]
+            keep += [start + chunk.argmin(), start + chunk.argmax()]
+    return frame.iloc[np.unique(keep)]
+
+def build_filter_mask(df, start_date, end_date, districts, ucr_filter, shooting_filter):
+    # Masks are built on the raw datetime64 / category-code arrays and combined
+    # in place, so each active filter is one pass over a flat buffer.
+
+    # Base mask: date range
+    date_only = df["DATE_ONLY"].values
+    mask = date_only >= np.datetime64(start_date)
+    mask &= date_only <= np.datetime64(end_date)
+
+    # District mask: lookup table indexed by code, last slot (code -1 / NaN) stays False
+    if districts:
+        district_codes = df["DISTRICT"].cat.codes.to_numpy()
+        allowed = np.zeros(len(df["DISTRICT"].cat.categories) + 1, dtype=bool)
+        idx = df["DISTRICT"].cat.categories.get_indexer(list(districts))
+        allowed[idx[idx >= 0]] = True
+        mask &= allowed[district_codes]
+
+    # UCR Part mask
+    if ucr_filter == "Part One only":
+        mask &= df["UCR_PART"].cat.codes.to_numpy() == category_code(df["UCR_PART"], "Part One")
+    elif ucr_filter == "Part Two only":
+        mask &= df["UCR_PART"].cat.codes.to_numpy() == category_code(df["UCR_PART"], "Part Two")
+
+    # Shooting mask
+    if shooting_filter == "Shooting only":
+        mask &= df["SHOOTING"].cat.codes.to_numpy() >= 0
+    elif shooting_filter == "Non-shooting only":
+        mask &= df["SHOOTING"].cat.codes.to_numpy() < 0
+
+    return mask
+
+# Everything shown on the page is derived here and cached per filter selection,
+# so reruns with a combination seen before skip filtering and aggregation.
+# `df` comes from st.cache_resource and lives as long as the cache, so its id()
+# is a stable, O(1) key for it. Rows are never materialized as a filtered
+# frame: each aggregate reads only its own column under the mask.
+@st.cache_data(hash_funcs={pd.DataFrame: id}, max_entries=64)
+def compute_aggregates(df, start_date, end_date, districts, ucr_filter, shooting_filter):
+    mask = build_filter_mask(df, start_date, end_date, districts, ucr_filter, shooting_filter)
+    total = int(np.count_nonzero(mask))
+
+    # KPIs: counted on the code arrays under the mask, nothing is gathered
+    ucr_codes = df["UCR_PART"].cat.codes.to_numpy()
+    part_one = int(np.count_nonzero(mask & (ucr_codes == category_code(df["UCR_PART"], "Part One"))))
+    part_two = int(np.count_nonzero(mask & (ucr_codes == category_code(df["UCR_PART"], "Part Two"))))
+    shootings = int(np.count_nonzero(mask & (df["SHOOTING"].cat.codes.to_numpy() >= 0)))
+
+    # Daily counts: bincount over day offsets (empty days come out as 0, like resample)
+    days = df["DATE_ONLY"].values[mask].astype("datetime64[D]").astype(np.int64)
+    first_day = days.min() if days.size else 0
+    counts = np.bincount(days - first_day)
+    dates = np.arange(first_day, first_day + counts.size).astype("datetime64[D]")
+    daily_counts = pd.DataFrame({"count": counts}, index=pd.DatetimeIndex(dates))
+    # 7-day trailing mean via prefix sums (same as rolling(7, min_periods=1).mean())
+    csum = np.concatenate(([0.0], np.cumsum(counts, dtype=np.float64)))
+    ends = np.arange(1, len(csum))
+    window = np.minimum(ends, 7)
+    daily_counts["rolling_7d"] = (csum[ends] - csum[ends - window]) / window
+    # only ship the per-bin extremes to the browser; peaks survive, dense noise doesn't
+    daily_counts = downsample_minmax(daily_counts)
+
+    # District counts (value_counts on a categorical also lists unobserved
+    # categories, so drop zeros), sorted alphabetically by index
+    dist_counts = df["DISTRICT"][mask].value_counts()
+    dist_counts = dist_counts[dist_counts > 0].to_frame(name="Count").sort_index()
+
+    # Offense group counts, largest first
+    offense_counts_full = df["OFFENSE_CODE_GROUP"][mask].value_counts()
+    offense_counts_full = (
+        offense_counts_full[offense_counts_full > 0]
+        .rename_axis("OFFENSE_CODE_GROUP")
+        .reset_index(name="count")
+    )
+
+    # sample row positions with valid coordinates for performance, then gather
+    # just those rows and the columns the map needs
+    geo_cols = ["Lat", "Long", "DISTRICT", "OFFENSE_CODE_GROUP", "OCCURRED_ON_DATE"]
+    valid = np.flatnonzero(mask & df["Lat"].notna().to_numpy() & df["Long"].notna().to_numpy())
+    if valid.size > 4000:
+        valid = np.sort(np.random.default_rng(42).choice(valid, 4000, replace=False))
+    geo = df.iloc[valid, df.columns.get_indexer(geo_cols)]
+
+    return (
+        total,
+        part_one,
+        part_two,
+        shootings,
+        daily_counts,
+        dist_counts,
+        offense_counts_full,
+        geo,
+    )
+
 if uploaded_file is None:
     st.info("⬅️ Please upload **crime.csv** to start.")
     st.stop()
 
 df = load_data(uploaded_file)
+districts, min_date, max_date = load_filter_options(df)
 
 # -----------------------------------------------------------
 # Filters
 # -----------------------------------------------------------
-min_date = df["OCCURRED_ON_DATE"].dt.date.min()
-max_date = df["OCCURRED_ON_DATE"].dt.date.max()
-
 date_range = st.sidebar.date_input(
     "Select date range",
     value=(min_date, max_date),
@@ -55,7 +266,6 @@ else:
     start_date = end_date = date_range
 
 # District filter
-districts = sorted(df["DISTRICT"].dropna().unique().tolist())
 selected_districts = st.sidebar.multiselect(
     "Filter by district",
     options=districts,
@@ -76,47 +286,38 @@ shooting_filter = st.sidebar.radio(
     index=0,
 )
 
-# Base mask: date range
-mask = (df["OCCURRED_ON_DATE"].dt.date >= start_date) & \
-       (df["OCCURRED_ON_DATE"].dt.date <= end_date)
-
-# District mask
-if selected_districts:
-    mask &= df["DISTRICT"].isin(selected_districts)
-
-# UCR Part mask
-if ucr_filter == "Part One only":
-    mask &= df["UCR_PART"] == "Part One"
-elif ucr_filter == "Part Two only":
-    mask &= df["UCR_PART"] == "Part Two"
-
-# Shooting mask
-if shooting_filter == "Shooting only":
-    mask &= df["SHOOTING"].notna() & (df["SHOOTING"] != "")
-elif shooting_filter == "Non-shooting only":
-    mask &= df["SHOOTING"].isna() | (df["SHOOTING"] == "")
-
-filtered = df.loc[mask].copy()
+(
+    total_offenses,
+    part_one,
+    part_two,
+    shootings,
+    daily_counts,
+    dist_counts,
+    offense_counts_full,
+    geo,
+) = compute_aggregates(
+    df,
+    start_date,
+    end_date,
+    tuple(sorted(selected_districts)),
+    ucr_filter,
+    shooting_filter,
+)
 
-st.sidebar.write(f"**Showing {len(filtered):,} records**")
+st.sidebar.write(f"**Showing {total_offenses:,} records**")
 
-if filtered.empty:
+if total_offenses == 0:
     st.warning("No data available for selected filters.")
     st.stop()
 
 # -----------------------------------------------------------
 # KPI metric cards (no headline summary text line)
 # -----------------------------------------------------------
-total_offenses = len(filtered)
-ucr_part_one = filtered.loc[filtered["UCR_PART"] == "Part One"]
-ucr_part_two = filtered.loc[filtered["UCR_PART"] == "Part Two"]
-shootings = filtered.loc[filtered["SHOOTING"].notna() & (filtered["SHOOTING"] != "")]
-
 c0, c1, c2, c3 = st.columns(4)
 c0.metric("Total Offenses", total_offenses)
-c1.metric("UCR Part One Offenses", len(ucr_part_one))
-c2.metric("UCR Part Two Offenses", len(ucr_part_two))
-c3.metric("Shooting Incidents", len(shootings))
+c1.metric("UCR Part One Offenses", part_one)
+c2.metric("UCR Part Two Offenses", part_two)
+c3.metric("Shooting Incidents", shootings)
 
 st.markdown("---")
 
@@ -125,32 +326,25 @@ st.markdown("---")
 # -----------------------------------------------------------
 st.subheader("📈 Daily Crime Volume (7-Day Rolling Average)")
 
-daily_counts = (
-    filtered
-    .set_index("OCCURRED_ON_DATE")
-    .resample("D")
-    .size()
-    .to_frame(name="count")
+# wide frame + fold in the spec: half the rows st.line_chart would ship after melting
+daily_chart = (
+    alt.Chart(daily_counts.rename_axis("date").reset_index())
+    .transform_fold(["count", "rolling_7d"], as_=["series", "value"])
+    .mark_line()
+    .encode(
+        x=alt.X(field="date", type="temporal", title=None),
+        y=alt.Y(field="value", type="quantitative", title=None),
+        color=alt.Color(field="series", type="nominal", legend=alt.Legend(title=None)),
+    )
 )
-daily_counts["rolling_7d"] = daily_counts["count"].rolling(window=7, min_periods=1).mean()
 
-st.line_chart(daily_counts)
+st.altair_chart(daily_chart, use_container_width=True)
 
 # -----------------------------------------------------------
 # 2) Crimes by district – bar chart (alphabetical order)
 # -----------------------------------------------------------
 st.subheader("🏙️ Crimes by District")
 
-dist_counts = (
-    filtered
-    .groupby("DISTRICT")
-    .size()
-    .to_frame(name="Count")
-)
-
-# Sort districts alphabetically by index
-dist_counts = dist_counts.sort_index()
-
 st.bar_chart(dist_counts)
 
 # -----------------------------------------------------------
@@ -158,14 +352,6 @@ st.bar_chart(dist_counts)
 # -----------------------------------------------------------
 st.subheader("🔍 Offense Groups (Top 10 + Others)")
 
-offense_counts_full = (
-    filtered
-    .groupby("OFFENSE_CODE_GROUP")
-    .size()
-    .reset_index(name="count")
-    .sort_values("count", ascending=False)
-)
-
 if offense_counts_full.empty:
     st.info("No offense data available for the selected filters.")
 else:
@@ -206,17 +392,10 @@ else:
 # -----------------------------------------------------------
 st.subheader("🗺 Location of Crime Incidents (colored by district)")
 
-geo = filtered.dropna(subset=["Lat", "Long"]).copy()
-
-# sample for performance
-if len(geo) > 4000:
-    geo = geo.sample(4000, random_state=42)
-
 if geo.empty:
     st.info("No geocoded incidents available for the selected filters.")
 else:
-    # build a color map for districts
-    unique_districts = sorted(geo["DISTRICT"].dropna().unique())
+    # build a color palette for districts, indexed by category code
     color_palette = [
         [230, 25, 75],   # red
         [60, 180, 75],   # green
@@ -232,21 +411,38 @@ else:
         [128, 128, 0],   # olive
         [0, 0, 128],     # navy
     ]
-    color_map = {
-        d: color_palette[i % len(color_palette)]
-        for i, d in enumerate(unique_districts)
-    }
-
-    # assign colors (fallback gray for NaN)
-    geo["color"] = geo["DISTRICT"].map(color_map)
-    geo["color"] = geo["color"].apply(
-        lambda c: c if isinstance(c, list) else [200, 200, 200]
+    palette = np.array(color_palette + [[200, 200, 200]], dtype=np.uint8)
+
+    # assign colors with one gather (last palette row is the gray fallback for NaN)
+    codes = geo["DISTRICT"].cat.codes.to_numpy()
+    codes = np.where(codes < 0, len(color_palette), codes % len(color_palette))
+    geo_colors = palette[codes]
+
+    # one prebuilt tooltip string per point, so only it (not the source columns) is shipped
+    tips = (
+        "District: " + geo["DISTRICT"].astype(str)
+        + "\nOffense: " + geo["OFFENSE_CODE_GROUP"].astype(str)
+        + "\nDate: " + geo["OCCURRED_ON_DATE"].dt.strftime("%Y-%m-%d %H:%M")
+    )
+
+    # [lon, lat] per point, rounded to ~1 m so the JSON stays short
+    # (float32 values would otherwise serialize with float64-length digits)
+    positions = geo[["Long", "Lat"]].to_numpy(np.float64).round(5)
+
+    # st.pydeck_chart always sends layer data as JSON (pydeck's binary transport
+    # only works in Jupyter), so assemble the payload column-wise from the arrays
+    map_data = pd.DataFrame(
+        {
+            "position": positions.tolist(),
+            "color": geo_colors.tolist(),
+            "tip": tips.to_numpy(),
+        }
     )
 
     layer = pdk.Layer(
         "ScatterplotLayer",
-        data=geo,
-        get_position=["Long", "Lat"],
+        data=map_data,
+        get_position="position",
         get_radius=40,
         get_fill_color="color",
         pickable=True,
@@ -262,9 +458,7 @@ else:
         bearing=0,
     )
 
-    tooltip = {
-        "text": "District: {DISTRICT}\nOffense: {OFFENSE_CODE_GROUP}\nDate: {OCCURRED_ON_DATE}"
-    }
+    tooltip = {"text": "{tip}"}
 
     deck = pdk.Deck(
         layers=[layer],